@@ -1,18 +1,29 @@
 import argparse
+import csv
 import textwrap
-import pandas as pd
 
 #test
 def write_copyright_signatures(submissions_path):
 
     def clean_str(value):
-        return '' if pd.isna(value) else value.strip()
+        # csv gives '' for empty cells and None for cells missing from short rows
+        return (value or '').strip()
 
     # write all copyright signatures to a single file, noting any problems
-    with open("copyright-signatures.txt", "w") as output_file:
-        df = pd.read_csv(submissions_path, keep_default_na=False)
-        for index, row in df.iterrows():
-            submission_id = row["Submission ID"]
+    # (utf-8-sig also drops the byte-order mark of Excel's "CSV UTF-8" export)
+    with open("copyright-signatures.txt", "w") as output_file, \
+            open(submissions_path, newline='', encoding='utf-8-sig') as submissions_file:
+        # column names of the (up to 24) authors' names and affiliation, built
+        # once here rather than formatted again for every row
+        author_columns = [
+            ([f'{i}: {x} Name' for x in ['First', 'Middle', 'Last']], f'{i}: Affiliation')
+            for i in range(1, 25)]
+
+        # rows are streamed one at a time as dicts of strings
+        for row in csv.DictReader(submissions_file):
+            # cells missing from a short row are None, print them as empty
+            submission_id = row["Submission ID"] or ''
+            title = row["Title"] or ''
 
             # NOTE: These were the names in the custom final submission form
             # for NAACL 2021. Names and structure may be different depending
@@ -23,13 +34,11 @@ def write_copyright_signatures(submissions_path):
 
             # collect all authors and their affiliations
             authors_parts = []
-            for i in range(1, 25):
-                name_parts = [
-                    clean_str(row[f'{i}: {x} Name'])
-                    for x in ['First', 'Middle', 'Last']]
+            for name_columns, affiliation_column in author_columns:
+                name_parts = [clean_str(row[x]) for x in name_columns]
                 name = ' '.join(x for x in name_parts if x)
                 if name:
-                    affiliation = clean_str(row[f"{i}: Affiliation"])
+                    affiliation = clean_str(row[affiliation_column])
                     authors_parts.append(f'{name} ({affiliation})')
             authors = '\n'.join(authors_parts)
 
@@ -37,7 +46,7 @@ def write_copyright_signatures(submissions_path):
             indent = " " * 4
             output_file.write(f"""
 Submission # {submission_id}
-Title: {row["Title"]}
+Title: {title}
 Authors:
 {textwrap.indent(authors, indent)}
 Signature: {signature}
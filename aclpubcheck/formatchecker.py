@@ -3,10 +3,13 @@ python3 formatchecker.py [-h] [--paper_type {long,short,demo,other}] file_or_dir
 '''
 
 import argparse
+import copy
 from argparse import Namespace
 import json
 from enum import Enum
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property
 from os import walk
 from os.path import isfile, join
 import pdfplumber
@@ -16,6 +19,21 @@ import os
 import numpy as np
 import traceback
 
+# PyMuPDF is optional, it is only used for faster plain-text extraction
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf  # PyMuPDF < 1.24.3
+    except ImportError:
+        pymupdf = None
+
+# orjson is optional, it only speeds up writing the log files
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from .name_check import PDFNameCheck
 
 
@@ -32,6 +50,15 @@ class Warn(Enum):
     BIB = "Bibliography"
 
 
+# the log buckets, in the order the checks run: this is the order in which the
+# errors are reported
+LOG_KINDS = (Error.SIZE, Error.PARSING, Error.MARGIN, Error.PAGELIMIT, Error.FONT, Error.SPELLING, Warn.BIB)
+
+# json keys of the log buckets (e.g. "Error.SIZE"), computed once instead of
+# formatting the enum member for every submission
+LOG_KEYS = {kind: str(kind) for kind in LOG_KINDS}
+
+
 class Page(Enum):
     # 595 pixels (72ppi) = 21cm
     WIDTH = 595
@@ -46,8 +73,116 @@ class Margin(Enum):
     LEFT = "left"
 
 
+# the margins returned by margin_violations, indexed by their code
+MARGIN_CODES = (None, Margin.TOP, Margin.LEFT, Margin.RIGHT)
+
+
+def margin_violations(x0, x1, top, bottom, top_limit, left_limit, right_limit, page_width):
+    """ Returns, for each of the boxes, the code of the margin it bleeds into
+    (the top, left and right margins are checked in this order) or 0 if none. """
+
+    top_violation = (np.trunc(bottom) > 0) & (top < top_limit)
+    left_violation = (np.trunc(x1) > 0) & (x0 < left_limit)
+    right_violation = (np.trunc(x0) < page_width) & (page_width - x1 < right_limit)
+    return np.select([top_violation, left_violation, right_violation], [1, 2, 3], default=0)
+
+
+def is_colored(obj):
+    """ Returns whether a pdfplumber char or word is neither black nor uncolored. """
+
+    #if obj["non_stroking_color"] == (0, 0, 0) or obj["non_stroking_color"] == 0 or obj["stroking_color"] == 0:
+    if obj["non_stroking_color"] == (0, 0, 0) or obj["non_stroking_color"] == [0]:
+        return False
+
+    if obj["non_stroking_color"] is None and obj["stroking_color"] is None:
+        return False
+    return True
+
+
+def object_bboxes(objects):
+    """ Returns the boxes of pdfplumber objects (chars, words, images), one
+    (x0, x1, top, bottom) row per object. """
+
+    return np.array([(o["x0"], o["x1"], o["top"], o["bottom"]) for o in objects], dtype=float).reshape(-1, 4)
+
+
+class CachedPage(object):
+    """ A pdfplumber page whose text and words are extracted at most once.
+    pdfplumber already parses the objects of a page (chars, images) only once,
+    but runs `extract_text` and `extract_words` again on every call; the text
+    is needed by both check_page_num and check_references. If the same page
+    opened with PyMuPDF is given (or set later), it is used for `plain_text`. """
+
+    def __init__(self, page, mupdf_page=None):
+        self.page = page
+        self.mupdf_page = mupdf_page
+
+    @property
+    def width(self):
+        return self.page.width
+
+    @property
+    def height(self):
+        return self.page.height
+
+    @property
+    def chars(self):
+        return self.page.chars
+
+    @cached_property
+    def words(self):
+        return self.page.extract_words(extra_attrs=["non_stroking_color", "stroking_color"])
+
+    @property
+    def images(self):
+        return self.page.images
+
+    @property
+    def hyperlinks(self):
+        return self.page.hyperlinks
+
+    @cached_property
+    def text(self):
+        return self.page.extract_text()
+
+    @cached_property
+    def plain_text(self):
+        # MuPDF does not order the lines like pdfplumber does, so this is only
+        # meant for checks that do not care about line positions
+        if self.mupdf_page is not None:
+            return self.mupdf_page.get_text()
+        return self.text
+
+    def crop(self, bbox):
+        return self.page.crop(bbox)
+
+    def to_image(self, resolution=None):
+        return self.page.to_image(resolution=resolution)
+
+
 class Formatter(object):
 
+    # the main font must end with one of these names; a tuple so that a single
+    # str.endswith call can test all of them
+    correct_fontnames = ("NimbusRomNo9L-Regu",
+                         "TeXGyreTermesX-Regular",
+                         "TimesNewRomanPSMT",
+                         "ICWANT+STIXGeneral-Regular",
+                         "ICZIZQ+Inconsolatazi4-Regular"
+                         )
+
+    # the name checking parameters are the same for every submission, only the
+    # file changes; see make_name_check_config
+    name_check_template = Namespace(
+        show_names=False, # Show how the name is changed
+        whole_name=False, # Consider the whole name changes
+        first_name=True, # Consider only first name changes
+        last_name=True, # Consider only last name changes
+        ref_string='References', # How the bibilography starts
+        mode='ensemble', # The mode for scholarcy, ensemble worked the best for ACL papers
+        initials=True # Allow abbreviating first names to initials only.
+    )
+
     def __init__(self):
         # TODO: these should be constants
         self.right_offset = 4.5
@@ -62,35 +197,59 @@ class Formatter(object):
         self.background_color = 255
         self.pdf_namecheck = PDFNameCheck()
 
+        # whether to save a PNG of each page with margin errors, highlighting them
+        self.render_debug_images = True
+
+        # one bucket per log type, created up front so that appending a message
+        # never has to go through defaultdict's missing-key path
+        self.logs = {kind: [] for kind in LOG_KINDS}
+        self._pages = None
+        self.mupdf_doc = None
+        self.use_mupdf = False
+
 
-    def format_check(self, submission, paper_type, output_dir = ".", print_only_errors = False, check_references = False):
+    def format_check(self, submission, paper_type, output_dir = ".", print_only_errors = False, check_references = False, use_mupdf = False):
         """
         Return True if the paper is correct, False otherwise.
+        With use_mupdf, the text searched by check_references is extracted with
+        PyMuPDF, which is faster but may give slightly different warnings.
         """
+        if use_mupdf and pymupdf is None:
+            raise ImportError("use_mupdf requires PyMuPDF (pip install pymupdf)")
         print(f"Checking {submission}")
 
         # TOOD: make this less of a hack
         self.number = submission.split("/")[-1].split("_")[0].replace(".pdf", "")
         self.pdf = pdfplumber.open(submission)
-        self.logs = defaultdict(list)  # reset log before calling the format-checking functions
+        self._pages = None  # filled in by the first check that needs the pages
+        self.mupdf_doc = None  # only opened by check_references, see open_mupdf
+        self.use_mupdf = use_mupdf
+
+        self.logs = {kind: [] for kind in LOG_KINDS}  # reset log before calling the format-checking functions
         self.page_errors = set()
         self.pdfpath = submission
 
         # TODO: A few papers take hours to check. Consider using a timeout
-        self.check_page_size()
-        self.check_page_margin(output_dir)
-        self.check_page_num(paper_type)
-        self.check_font()
-
-        if check_references:
-            self.check_references()
+        try:
+            self.check_page_size()
+            self.check_page_margin(output_dir)
+            self.check_page_num(paper_type)
+            self.check_font()
+
+            if check_references:
+                self.check_references()
+        finally:
+            # nothing below needs the pages: with many submissions checked in the
+            # same process, keeping them would hold every parsed paper in memory
+            self.close_pdf()
+
+        # only the log types that actually got messages are reported
+        self.logs = {k: v for k, v in self.logs.items() if v}
 
         # TODO: put json dump back on
         output_file = "errors-{0}.json".format(self.number)
         # string conversion for json dump
-        logs_json = {}
-        for k, v in self.logs.items():
-            logs_json[str(k)] = v
+        logs_json = {LOG_KEYS[k]: v for k, v in self.logs.items()}
 
         if self.logs:
             print(f"Errors. Check {output_file} for details.")
@@ -119,7 +278,7 @@ class Formatter(object):
 
 
             if print_only_errors == False:
-                json.dump(logs_json, open(os.path.join(output_dir,output_file), 'w'))  # always write a log file even if it is empty
+                dump_logs(logs_json, os.path.join(output_dir,output_file))  # always write a log file even if it is empty
 
             # display to user
             print()
@@ -137,154 +296,198 @@ class Formatter(object):
 
         else:
             if print_only_errors == False:
-                json.dump(logs_json, open(os.path.join(output_dir,output_file), 'w'))
+                dump_logs(logs_json, os.path.join(output_dir,output_file))
 
             print(colored("All Clear!", "green"))
             return logs_json
 
 
 
+    def close_pdf(self):
+        """ Releases the pages of the submission, their cached content and the open files. """
+
+        self._pages = None
+        self.pdf.close()
+        if self.mupdf_doc is not None:
+            self.mupdf_doc.close()
+            self.mupdf_doc = None
+
+
+    def cached_pages(self):
+        """ Returns the pages of the submission, wrapped so that their text and
+        words are extracted only once across all the checks. """
+
+        if self._pages is None:
+            self._pages = [CachedPage(page) for page in self.pdf.pages]
+        return self._pages
+
+
+    def open_mupdf(self):
+        """ Opens the submission with PyMuPDF, if it is installed and can read
+        the file, and gives each cached page its MuPDF page for `plain_text`.
+        MuPDF extracts plain text much faster than pdfminer. """
+
+        pages = self.cached_pages()
+        if pymupdf is None or self.mupdf_doc is not None:
+            return
+        try:
+            self.mupdf_doc = pymupdf.open(self.pdfpath)
+        except Exception:
+            return
+        if len(self.mupdf_doc) != len(pages):
+            self.mupdf_doc.close()
+            self.mupdf_doc = None
+            return
+        for page, mupdf_page in zip(pages, self.mupdf_doc):
+            page.mupdf_page = mupdf_page
+
+
     def check_page_size(self):
         """ Checks the paper size (A4) of each pages in the submission. """
 
-        pages = []
-        for i, page in enumerate(self.pdf.pages):
-
-            if (round(page.width), round(page.height)) != (Page.WIDTH.value, Page.HEIGHT.value):
-                pages.append(i+1)
-        for page in pages:
-            error = "Page #{} is not A4.".format(page)
-            self.logs[Error.SIZE] += [error]
+        # one (width, height) row per page, rounded like round() does (half to even)
+        sizes = np.rint(np.array([(page.width, page.height) for page in self.cached_pages()], dtype=float).reshape(-1, 2))
+        pages = (np.flatnonzero((sizes != (Page.WIDTH.value, Page.HEIGHT.value)).any(axis=1)) + 1).tolist()
+        if pages:
+            self.logs[Error.SIZE] += ["Page #{} is not A4.".format(page) for page in pages]
         self.page_errors.update(pages)
 
 
     def check_page_margin(self, output_dir):
         """ Checks if any text or figure is in the margin of pages. """
 
+        # bind the constants used in the per-word loop once
+        page_width, page_height = Page.WIDTH.value, Page.HEIGHT.value
+        top_offset, left_offset = self.top_offset, self.left_offset
+        right_offset, bottom_offset = self.right_offset, self.bottom_offset
+
         pages_image = defaultdict(list)
         pages_text = defaultdict(list)
         perror = []
-        for i, p in enumerate(self.pdf.pages):
+        cached_pages = self.cached_pages()
+        for i, p in enumerate(cached_pages):
             if i+1 in self.page_errors:
                 continue
+            crops = {}  # bbox -> whether the cropped area has visible content
             try:
                 # Parse images
                 # 57 pixels (72ppi) = 2cm; 71 pixels (72ppi) = 2.5cm.
-                for image in p.images:
-                    violation = None
-                    if int(image["bottom"]) > 0 and float(image["top"]) < (57-self.top_offset):
-                        violation = Margin.TOP
-                    elif int(image["x1"]) > 0 and float(image["x0"]) < (71-self.left_offset):
-                        violation = Margin.LEFT
-                    elif int(image["x0"]) < Page.WIDTH.value and Page.WIDTH.value-float(image["x1"]) < (71-self.right_offset):
-                        violation = Margin.RIGHT
-
-                    if violation:
-                        # if the image is completely white, it can be skipped
-
-                        # get the actual visible area
-                        x0 = max(0, int(image["x0"]))
-                        # check the intersection with the right margin to handle larger images
-                        # but with an "overflow" that is of the same color of the backgrond
-                        if violation == Margin.RIGHT:
-                            x0 = max(x0, Page.WIDTH.value - 71 + self.right_offset)
-
-                        x1 = min(int(image["x1"]), Page.WIDTH.value)
-                        if violation == Margin.LEFT:
-                            x1 = min(x1, 71 - self.right_offset)
-
-                        y0 = max(0, int(image["top"]))
-
-                        y1 = min(int(image["bottom"]), Page.HEIGHT.value)
-                        if violation == Margin.TOP:
-                            y1 = min(y1, 57-self.top_offset)
-
-                        bbox = (x0, y0, x1, y1)
-
-                        # avoid problems in cropping images too small
-                        if x1 - x0 <= 1 or y1 - y0 <= 1:
-                            continue
-
-                        # cropping the image to check if it is white
-                        # i.e., all pixels set to 255
-                        cropped_page = p.crop(bbox)
-                        try:
-                          image_obj = cropped_page.to_image(resolution=100)
-                          if np.mean(image_obj.original) != self.background_color:
-                            pages_image[i] += [(image, violation)]
-                        # if there are some errors during cropping, it is better to check
-                        except:
-                          pages_image[i] += [(image, violation)]
+                images = p.images
+                codes = margin_violations(*object_bboxes(images).T,
+                                          57-top_offset, 71-left_offset, 71-right_offset, page_width)
+                for j in np.flatnonzero(codes):
+                    image = images[j]
+                    violation = MARGIN_CODES[codes[j]]
+
+                    # if the image is completely white, it can be skipped
+
+                    # get the actual visible area
+                    x0 = max(0, int(image["x0"]))
+                    # check the intersection with the right margin to handle larger images
+                    # but with an "overflow" that is of the same color of the backgrond
+                    if violation == Margin.RIGHT:
+                        x0 = max(x0, page_width - 71 + right_offset)
 
-                # Parse texts
-                for j, word in enumerate(p.extract_words(extra_attrs=["non_stroking_color", "stroking_color"])):
-                    violation = None
+                    x1 = min(int(image["x1"]), page_width)
+                    if violation == Margin.LEFT:
+                        x1 = min(x1, 71 - right_offset)
+
+                    y0 = max(0, int(image["top"]))
+
+                    y1 = min(int(image["bottom"]), page_height)
+                    if violation == Margin.TOP:
+                        y1 = min(y1, 57-top_offset)
+
+                    bbox = (x0, y0, x1, y1)
+
+                    # avoid problems in cropping images too small
+                    if x1 - x0 <= 1 or y1 - y0 <= 1:
+                        continue
+
+                    # cropping the image to check if it is white
+                    # i.e., all pixels set to 255
+                    try:
+                      if self.crop_has_content(p, bbox, crops):
+                        pages_image[i] += [(image, violation)]
+                    # if there are some errors during cropping, it is better to check
+                    except:
+                      pages_image[i] += [(image, violation)]
 
-                    #if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == 0 or word["stroking_color"] == 0:
-                    if word["non_stroking_color"] == (0, 0, 0) or word["non_stroking_color"] == [0]:
+                # Parse texts
+                # the box of a word is the union of the boxes of its chars, so a word
+                # can only bleed into a margin if one of its chars does: when no char
+                # does, the (expensive) grouping of the chars into words is skipped
+                # words are split where the color changes, so the chars of a word have
+                # its colors and black or uncolored words need no char in the margin
+                chars = p.chars
+                boxes = object_bboxes(chars)
+                in_margin = np.flatnonzero((boxes[:, 2] < 57-top_offset) | (boxes[:, 0] < 71-left_offset)
+                                           | (page_width - boxes[:, 1] < 71-right_offset))
+                if any(is_colored(chars[k]) for k in in_margin):
+                    words = p.words
+                else:
+                    words = []
+
+                # the margin tests run on all the words of the page at once, so only
+                # the words that are in a margin are then looked at one by one
+                x0s, x1s, tops, bottoms = object_bboxes(words).T
+                codes = margin_violations(x0s, x1s, tops, bottoms,
+                                          57-top_offset, 71-left_offset, 71-right_offset, page_width)
+                # the word should also be (at least partially) inside the page
+                codes[(np.trunc(x0s) >= page_width) | (np.trunc(x1s) < 0) | (np.trunc(bottoms) < 0)] = 0
+                for j in np.flatnonzero(codes):
+                    word = words[j]
+                    violation = MARGIN_CODES[codes[j]]
+
+                    if not is_colored(word):
                         continue
 
-                    if word["non_stroking_color"] is None and word["stroking_color"] is None:
+                    # if the area image is completely white, it can be skipped
+                    # get the actual visible area
+                    x0 = max(0, int(word["x0"]))
+                    # check the intersection with the right margin to handle larger images
+                    # but with an "overflow" that is of the same color of the backgrond
+                    if violation == Margin.RIGHT:
+                        x0 = max(x0, page_width - 71 + right_offset)
+
+                    x1 = min(int(word["x1"]), page_width)
+                    if violation == Margin.LEFT:
+                        x1 = min(x1, 71 - right_offset)
+
+                    y0 = max(0, int(word["top"]))
+
+                    y1 = min(int(word["bottom"]), page_height)
+                    if violation == Margin.TOP:
+                        y1 = min(y1, 57-top_offset)
+
+                    bbox = (x0, y0, x1, y1)
+
+                    # avoid problems in cropping images too small
+                    if x1 - x0 <= 1 or y1 - y0 <= 1:
                         continue
 
-                    if int(word["bottom"]) > 0 and float(word["top"]) < (57-self.top_offset):
-                        violation = Margin.TOP
-                    elif int(word["x1"]) > 0 and float(word["x0"]) < (71-self.left_offset):
-                        violation = Margin.LEFT
-                    elif int(word["x0"]) < Page.WIDTH.value and Page.WIDTH.value-float(word["x1"]) < (71-self.right_offset):
-                        violation = Margin.RIGHT
-
-                    if violation and int(word["x0"]) < Page.WIDTH.value and int(word["x1"]) >= 0 and int(word["bottom"]) >= 0:
-                        # if the area image is completely white, it can be skipped
-                        # get the actual visible area
-                        x0 = max(0, int(word["x0"]))
-                        # check the intersection with the right margin to handle larger images
-                        # but with an "overflow" that is of the same color of the backgrond
-                        if violation == Margin.RIGHT:
-                            x0 = max(x0, Page.WIDTH.value - 71 + self.right_offset)
-
-                        x1 = min(int(word["x1"]), Page.WIDTH.value)
-                        if violation == Margin.LEFT:
-                            x1 = min(x1, 71 - self.right_offset)
-
-                        y0 = max(0, int(word["top"]))
-
-                        y1 = min(int(word["bottom"]), Page.HEIGHT.value)
-                        if violation == Margin.TOP:
-                            y1 = min(y1, 57-self.top_offset)
-
-                        bbox = (x0, y0, x1, y1)
-
-                        # avoid problems in cropping images too small
-                        if x1 - x0 <= 1 or y1 - y0 <= 1:
-                            continue
-
-                        # cropping the image to check if it is white
-                        # i.e., all pixels set to 255
-                        try:
-                            cropped_page = p.crop(bbox)
-                            image_obj = cropped_page.to_image(resolution=100)
-                            if np.mean(image_obj.original) != self.background_color:
-                                print("Found text violation:\t" + str(violation) + "\t" + str(word))
-                                pages_text[i] += [(word, violation)]
-                        except:
-                          # if there are some errors during cropping, it is better to check
-                          pages_image[i] += [(word, violation)]
+                    # cropping the image to check if it is white
+                    # i.e., all pixels set to 255
+                    try:
+                        if self.crop_has_content(p, bbox, crops):
+                            print("Found text violation:\t" + str(violation) + "\t" + str(word))
+                            pages_text[i] += [(word, violation)]
+                    except:
+                      # if there are some errors during cropping, it is better to check
+                      pages_image[i] += [(word, violation)]
 
                 # CHECK THE AREA BELOW THE TEXT, it should be empty as it is expected to
                 # be populated with watermark and pages during the construction of the
                 # proceedings
                 if args.disable_bottom_check:
                     bpixels = 62
-                    bbox = (0, Page.HEIGHT.value - bpixels, Page.WIDTH.value - self.bottom_offset, Page.HEIGHT.value - self.bottom_offset)
+                    bbox = (0, page_height - bpixels, page_width - bottom_offset, page_height - bottom_offset)
                     word = {"top": bbox[1], "bottom": bbox[3]}
             
                     # cropping the image to check if it is white
                     # i.e., all pixels set to 255
                     try:
-                        cropped_page = p.crop(bbox)
-                        image_obj = cropped_page.to_image(resolution=100)
-                        if np.mean(image_obj.original) != self.background_color:
+                        if self.crop_has_content(p, bbox, crops):
                             print("Found text violation:\t" + str(Margin.BOTTOM) + "\t" + str(word))
                             pages_text[i] += [(word, Margin.BOTTOM)]
                     except:
@@ -302,27 +505,40 @@ class Formatter(object):
 
         if pages_text or pages_image:
             pages = sorted(set(pages_text.keys()).union(set((pages_image.keys()))))
+            text_templates = {
+                Margin.RIGHT: "Text on page {} bleeds into the right margin.",
+                Margin.LEFT: "Text on page {} bleeds into the left margin.",
+                Margin.TOP: "Text on page {} bleeds into the top margin.",
+                Margin.BOTTOM: "Text on page {} bleeds into the bottom margin. It should be empty (e.g., without page number) and populated when building the proceedings.",
+            }
+            # the messages are appended to the bucket directly, without looking it up each time
+            margin_logs = self.logs[Error.MARGIN]
             for page in pages:
-                im = self.pdf.pages[page].to_image(resolution=150)
+                # format the messages once per page: all the violations of the same
+                # kind on a page then share a single string instead of a copy each
+                text_messages = {margin: template.format(page+1) for margin, template in text_templates.items()}
+                image_message = "An image on page {} bleeds into the margin.".format(page+1)
+
+                rects = []  # areas to highlight in the debug image of the page
                 for (word, violation) in pages_text[page]:
 
                     bbox = None
                     if violation == Margin.RIGHT:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the right margin.".format(page+1)]
-                        bbox = (Page.WIDTH.value-80, int(word["top"]-20), Page.WIDTH.value-20, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                        margin_logs.append(text_messages[violation])
+                        bbox = (page_width-80, int(word["top"]-20), page_width-20, int(word["bottom"]+20))
+                        rects.append(bbox)
                     elif violation == Margin.LEFT:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the left margin.".format(page+1)]
+                        margin_logs.append(text_messages[violation])
                         bbox = (20, int(word["top"]-20), 80, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                        rects.append(bbox)
                     elif violation == Margin.TOP:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the top margin.".format(page+1)]
+                        margin_logs.append(text_messages[violation])
                         bbox = (20, int(word["top"]-20), 80, int(word["bottom"]+20))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                        rects.append(bbox)
                     elif violation == Margin.BOTTOM:
-                        self.logs[Error.MARGIN] += ["Text on page {} bleeds into the bottom margin. It should be empty (e.g., without page number) and populated when building the proceedings.".format(page+1)]
-                        bbox = (0, int(word["top"]), Page.WIDTH.value, int(word["bottom"]))
-                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                        margin_logs.append(text_messages[violation])
+                        bbox = (0, int(word["top"]), page_width, int(word["bottom"]))
+                        rects.append(bbox)
                     else:
                         # TODO: add bottom margin violations
                         pass
@@ -330,15 +546,36 @@ class Formatter(object):
 
                 for (image, violation) in pages_image[page]:
 
-                    self.logs[Error.MARGIN] += ["An image on page {} bleeds into the margin.".format(page+1)]
+                    margin_logs.append(image_message)
                     bbox = (image["x0"], image["top"], image["x1"], image["bottom"])
-                    im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                    rects.append(bbox)
 
-                png_file_name = "errors-{0}-page-{1}.png".format(*(self.number, page+1))
-                im.save(os.path.join(output_dir, png_file_name), format="PNG")
+                # rasterizing the page is by far the most expensive step of the
+                # check, so it is skipped entirely when no debug image is wanted
+                if self.render_debug_images:
+                    im = cached_pages[page].to_image(resolution=150)
+                    for bbox in rects:
+                        im.draw_rect(bbox, fill=None, stroke="red", stroke_width=5)
+                    png_file_name = "errors-{0}-page-{1}.png".format(*(self.number, page+1))
+                    im.save(os.path.join(output_dir, png_file_name), format="PNG")
                 #+ "Specific text: "+str([v for k, v in pages_text.values()])]
 
 
+    def crop_has_content(self, page, bbox, crops):
+        """ Checks if the area of the page in bbox contains anything other than the background color. """
+
+        # rasterizing a crop is the expensive part of the margin check, so the
+        # answer is cached per bbox for the page being checked
+        if bbox not in crops:
+            image_obj = page.crop(bbox).to_image(resolution=100)
+            # the background is white, i.e., the largest 8-bit value, so the crop
+            # is blank exactly when its darkest pixel is still the background
+            # (an empty raster is reported, as np.mean of it used to be NaN != 255)
+            pixels = np.asarray(image_obj.original, dtype=np.uint8)
+            crops[bbox] = bool(not pixels.size or pixels.min() < self.background_color)
+        return crops[bbox]
+
+
     def check_page_num(self, paper_type):
         """Check if the paper exceeds the page limit."""
 
@@ -352,18 +589,23 @@ class Formatter(object):
 
         # Find (references, acknowledgements, ethics).
         marker = None
-        if len(self.pdf.pages) <= page_threshold:
+        pages = self.cached_pages()
+        if len(pages) <= page_threshold:
             return
 
-        for i, page in enumerate(self.pdf.pages):
+        for i, page in enumerate(pages):
             if i+1 in self.page_errors:
                 continue
-            text = page.extract_text().split('\n')
-            for j, line in enumerate(text):
-                if marker is None and any(x in line for x in candidates):
-                    marker = (i+1, j+1)
-                #if "Acknowl" in line and all(x not in line for x in acks):
-                #    self.logs[Error.SPELLING] = ["'Acknowledgments' was misspelled."]
+            text = page.text
+            # the earliest occurrence of any candidate is on the first line
+            # containing one, so its line number is the count of newlines before it
+            positions = [pos for pos in (text.find(x) for x in candidates) if pos >= 0]
+            if positions:
+                marker = (i+1, text.count('\n', 0, min(positions)) + 1)
+                # only the first marker matters, the following pages need not be read
+                break
+            #if "Acknowl" in line and all(x not in line for x in acks):
+            #    self.logs[Error.SPELLING] = ["'Acknowledgments' was misspelled."]
 
         # if the first marker appears after the first line of page 10,
         # there is high probability the paper exceeds the page limit.
@@ -384,46 +626,31 @@ class Formatter(object):
     def check_font(self):
         """ Checks the fonts. """
 
-        correct_fontnames = set(["NimbusRomNo9L-Regu",
-                                 "TeXGyreTermesX-Regular",
-                                 "TimesNewRomanPSMT",
-                                 "ICWANT+STIXGeneral-Regular",
-                                 "ICZIZQ+Inconsolatazi4-Regular"
-                                 ])
-
-        fonts = defaultdict(int)
-        for i, page in enumerate(self.pdf.pages):
+        # Counter.update counts a whole page of fontnames in C; it is given a
+        # generator so that the chars are not copied into a list first
+        fonts = Counter()
+        for i, page in enumerate(self.cached_pages()):
             try:
-                for char in page.chars:
-                    fonts[char['fontname']] += 1
+                fonts.update(char['fontname'] for char in page.chars)
             except:
                 self.logs[Error.FONT] += [f"Can't parse page #{i+1}"]
 
-        max_font_count, max_font_name = max((count, name) for name, count in fonts.items())  # find most used font
+        max_font_name, max_font_count = fonts.most_common(1)[0]  # find most used font
         sum_char_count = sum(fonts.values())
 
         # TODO: make this a command line argument
         if max_font_count / sum_char_count < 0.35:  # the most used font should be used more than 35% of the time
             self.logs[Error.FONT] += ["Can't find the main font"]
 
-        if not any([max_font_name.endswith(correct_fontname) for correct_fontname in correct_fontnames]):  # the most used font should be `correct_fontname`
-            self.logs[Error.FONT] += [f"Wrong font. The main font used is {max_font_name} when it should a font in {correct_fontnames}."]
+        if not max_font_name.endswith(self.correct_fontnames):  # the most used font should be `correct_fontname`
+            self.logs[Error.FONT] += [f"Wrong font. The main font used is {max_font_name} when it should a font in {set(self.correct_fontnames)}."]
 
     def make_name_check_config(self):
         """Configure the name checking parameters"""
 
-        config_dict = {
-            'file': self.pdfpath,
-            'show_names': False, # Show how the name is changed
-            'whole_name': False, # Consider the whole name changes
-            'first_name': True, # Consider only first name changes
-            'last_name': True, # Consider only last name changes
-            'ref_string': 'References', # How the bibilography starts
-            'mode': 'ensemble', # The mode for scholarcy, ensemble worked the best for ACL papers
-            'initials': True # Allow abbreviating first names to initials only.
-        }
-
-        return Namespace(**config_dict)
+        config = copy.copy(self.name_check_template)
+        config.file = self.pdfpath
+        return config
 
 
     def check_references(self):
@@ -435,31 +662,32 @@ class Formatter(object):
         arxiv_url_count = 0
         all_url_count = 0
 
-        for i, page in enumerate(self.pdf.pages):
+        if self.use_mupdf:
+            self.open_mupdf()
+        for i, page in enumerate(self.cached_pages()):
             try:
-                page_text = page.extract_text()
+                page_text = page.plain_text
             except:
                 page_text = ""
                 self.logs[Warn.BIB] += [f"Can't parse page #{i+1}"]
 
-            lines = page_text.split('\n')
-            for j, line in enumerate(lines):
-                if "References" in line:
-                    found_references = True
-                    break
+            # the marker never spans lines, so there is no need to split the page
+            if "References" in page_text:
+                found_references = True
             if found_references:
                 arxiv_word_count += page_text.lower().count('arxiv')
-                urls = [h['uri'] for h in page.hyperlinks]
-                urls = set(urls)  # When link text spans more than one line, it returns the same url multiple times
+                urls = {h['uri'] for h in page.hyperlinks}  # When link text spans more than one line, it returns the same url multiple times
                 for url in urls:
                     if 'doi.org' in url:
                         doi_url_count += 1
                     elif 'arxiv.org' in url:
                         arxiv_url_count += 1
-                    all_url_count += 1
+                all_url_count += len(urls)
 
         # The following checks fail in ~60% of the papers. TODO: relax them a bit
 
+        # --disable_name_check is a store_false flag: the attribute is True unless
+        # the flag was given, and only then is the (slow) name check run at all
         if args.disable_name_check:
             config = self.make_name_check_config()
             output_strings = self.pdf_namecheck.execute(config)
@@ -481,10 +709,29 @@ class Formatter(object):
             self.logs[Warn.BIB] += ["Couldn't find any references."]
 
 
+def dump_logs(logs_json, path):
+    """ write the logs of a submission to a json file """
+    if orjson is not None:
+        # the same json, but compact and in UTF-8 rather than escaped to ASCII
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(logs_json))
+    else:
+        with open(path, 'w') as f:
+            json.dump(logs_json, f)
+
+
 args = None
 def worker(pdf_path, paper_type):
     """ process one pdf """
-    return Formatter().format_check(submission=pdf_path, paper_type=paper_type)
+    formatter = Formatter()
+    formatter.render_debug_images = args.disable_debug_images
+    return formatter.format_check(submission=pdf_path, paper_type=paper_type)
+
+
+def init_worker(worker_args):
+    """ share the parsed command line arguments with a worker process """
+    global args
+    args = worker_args
 
 
 def main():
@@ -497,6 +744,8 @@ def main():
     parser.add_argument('--num_workers', type=int, default=1)
     parser.add_argument('--disable_name_check', action='store_false')
     parser.add_argument('--disable_bottom_check', action='store_false')
+    parser.add_argument('--disable_debug_images', action='store_false',
+                        help="do not save a PNG of each page with margin errors")
 
 
     args = parser.parse_args()
@@ -516,9 +765,12 @@ def main():
         print(f"No PDF files found in {paths}")
 
     if args.num_workers > 1:
-        from multiprocessing.pool import Pool
-        with Pool(args.num_workers) as p:
-            list(tqdm(p.imap(worker, fileset), total=len(fileset)))
+        # worker processes do not inherit `args` under the spawn start method
+        with ProcessPoolExecutor(max_workers=args.num_workers,
+                                 initializer=init_worker, initargs=(args,)) as executor:
+            futures = [executor.submit(worker, submission, args.paper_type) for submission in fileset]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                future.result()
     else:
         # TODO: make the tqdm togglable
         #for submission in tqdm(fileset):
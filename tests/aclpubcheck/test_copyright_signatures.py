@@ -274,3 +274,53 @@ def test_write_copyright_signatures_unicode_support(tmp_path, monkeypatch):
     assert 'Chloé Dubois-Éclair (École Polytechnique)' in out
     assert 'Universität München' in out
     assert 'Straße 1, München' in out
+
+
+def make_raw_csv(tmp_path, data_row, encoding='utf-8'):
+    """Helper to write the header and one raw data line, without pandas."""
+    columns = ['Submission ID', 'Title', 'copyrightSig', 'orgName', 'orgAddress', 'jobTitle']
+    for i in range(1, 25):
+        columns += [f'{i}: First Name', f'{i}: Middle Name', f'{i}: Last Name', f'{i}: Affiliation']
+    csv_path = tmp_path / "input.csv"
+    with open(csv_path, 'w', encoding=encoding, newline='') as f:
+        f.write(','.join(columns) + '\r\n' + data_row + '\r\n')
+    return str(csv_path)
+
+
+def test_write_copyright_signatures_utf8_bom(tmp_path, monkeypatch):
+    """
+    Test that a CSV starting with a UTF-8 byte-order mark (as written by Excel) is read correctly.
+    """
+    csv_path = make_raw_csv(tmp_path, '808,Excel Export,Eve Sig,Org,Addr,,Eve,,Adams,Excel Inst' + ',' * 92,
+                            encoding='utf-8-sig')
+    monkeypatch.chdir(tmp_path)
+    cs.write_copyright_signatures(csv_path)
+    out = read_signatures_output(tmp_path / "copyright-signatures.txt")
+    assert "Submission # 808" in out
+    assert "Eve Adams (Excel Inst)" in out
+
+
+def test_write_copyright_signatures_short_rows(tmp_path, monkeypatch):
+    """
+    Test that cells missing at the end of a short row are treated as empty.
+    """
+    # the row stops after the first author's last name
+    csv_path = make_raw_csv(tmp_path, '909,Short Row,Sam Sig,,,,Sam,,Short')
+    monkeypatch.chdir(tmp_path)
+    cs.write_copyright_signatures(csv_path)
+    out = read_signatures_output(tmp_path / "copyright-signatures.txt")
+    assert "Submission # 909" in out
+    assert "Sam Short ()" in out
+    assert "Signature: Sam Sig" in out
+
+
+def test_write_copyright_signatures_short_row_without_title(tmp_path, monkeypatch):
+    """
+    Test that a row cut short before the title prints an empty title, not None.
+    """
+    csv_path = make_raw_csv(tmp_path, '910')
+    monkeypatch.chdir(tmp_path)
+    cs.write_copyright_signatures(csv_path)
+    out = read_signatures_output(tmp_path / "copyright-signatures.txt")
+    assert "Submission # 910\nTitle: \n" in out
+    assert "None" not in out
@@ -2,8 +2,22 @@ import pytest
 from types import SimpleNamespace
 from collections import defaultdict
 from unittest.mock import patch, MagicMock
-from aclpubcheck.formatchecker import Formatter, Error, Warn, Margin, Page
+from aclpubcheck.formatchecker import Formatter, CachedPage, Error, Warn, Margin, Page, MARGIN_CODES, margin_violations, dump_logs, worker
 import argparse
+import json
+import numpy as np
+from dataclasses import dataclass
+
+@dataclass(slots=True)
+class FakeImage:
+    """Stands in for both a cropped page and its rendered image."""
+    original: object = 0  # pixels; 0 is not the 255 background
+    def draw_rect(self, *args, **kwargs):
+        pass
+    def save(self, *args, **kwargs):
+        pass
+    def to_image(self, *args, **kwargs):
+        return self
 
 class DummyPage:
     def __init__(self, width=None, height=None, extract_text_result=None, images=None, words=None, hyperlinks=None, chars=None):
@@ -19,16 +33,10 @@ class DummyPage:
     def extract_words(self, extra_attrs=None):
         return self._words
     def crop(self, bbox):
-        im = MagicMock()
-        im.to_image.return_value.original = 255 * (1,)
-        # The test can set .to_image to raise or return an object as needed
-        return im
+        # a blank crop: every pixel has the background color
+        return FakeImage(original=255 * (1,))
     def to_image(self, resolution=None):
-        im = MagicMock()
-        im.draw_rect.return_value = None
-        im.save.return_value = None
-        im.original = 0  # so np.mean is not 255
-        return im
+        return FakeImage()
 
 
 def make_pdf_mock(pages):
@@ -90,6 +98,19 @@ def test_check_page_size_bad_pages():
     assert 1 in f.page_errors and 3 in f.page_errors
 
 
+def test_check_page_size_rounds_half_to_even():
+    """Test check_page_size rounds page sizes like round() does, i.e. halves to the even number."""
+    f = Formatter()
+    f.logs = defaultdict(list)
+    f.page_errors = set()
+    # 594.5 rounds to 594 (not A4), 842.5 rounds to 842 (A4)
+    pages = [DummyPage(width=594.5), DummyPage(height=842.5), DummyPage(width=595.5)]
+    f.pdf = make_pdf_mock(pages)
+    f.check_page_size()
+    assert f.logs[Error.SIZE] == ['Page #1 is not A4.', 'Page #3 is not A4.']
+    assert f.page_errors == {1, 3}
+
+
 def test_check_page_margin_text_and_image_violations(monkeypatch, tmp_path):
     """Test check_page_margin logs margin errors for text and image violations."""
     # Patch args.disable_bottom_check to False, as if not set
@@ -112,7 +133,9 @@ def test_check_page_margin_text_and_image_violations(monkeypatch, tmp_path):
         "top": 10,
         "bottom": 20
     }]
-    page = DummyPage(words=words, images=images, extract_text_result='Some text')
+    # Chars of the word above, so that the page is known to have text in the margin
+    chars = [{"non_stroking_color": (10, 10, 10), "stroking_color": None, "x0": 0, "x1": 30, "top": 10, "bottom": 20}]
+    page = DummyPage(words=words, images=images, chars=chars, extract_text_result='Some text')
     # Make crop().to_image().original be a value different from 255
     def crop_override(bbox):
         im = MagicMock()
@@ -135,6 +158,63 @@ def test_check_page_margin_text_and_image_violations(monkeypatch, tmp_path):
     assert any("Text on page 1 bleeds into the left margin." in msg or "An image on page 1 bleeds into the margin." in msg for msg in f.logs[Error.MARGIN])
 
 
+def test_check_page_margin_without_debug_images(monkeypatch, tmp_path):
+    """Test check_page_margin still logs margin errors but renders no page when debug images are disabled."""
+    monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_bottom_check=False))
+    f = Formatter()
+    f.render_debug_images = False
+    f.page_errors = set()
+    f.logs = defaultdict(list)
+    images = [{"x0": 0, "x1": 30, "top": 10, "bottom": 20}]
+    page = DummyPage(images=images)
+    page.crop = lambda bbox: FakeImage()  # the crop has content
+    rendered = []
+    page.to_image = lambda resolution=None: rendered.append(resolution)
+    f.pdf = make_pdf_mock([page])
+    f.number = "0001"
+    f.check_page_margin(str(tmp_path))
+    assert f.logs[Error.MARGIN] == ["An image on page 1 bleeds into the margin."]
+    assert rendered == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_check_page_margin_reports_empty_crop(monkeypatch, tmp_path):
+    """Test an area in the margin whose crop rasterizes to no pixels at all is reported."""
+    monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_bottom_check=False))
+    f = Formatter()
+    f.render_debug_images = False
+    f.page_errors = set()
+    f.logs = defaultdict(list)
+    page = DummyPage(images=[{"x0": 0, "x1": 30, "top": 10, "bottom": 20}])
+    page.crop = lambda bbox: FakeImage(original=())
+    f.pdf = make_pdf_mock([page])
+    f.number = "0001"
+    f.check_page_margin(str(tmp_path))
+    assert f.logs[Error.MARGIN] == ["An image on page 1 bleeds into the margin."]
+
+
+def test_worker_sets_debug_images_from_args(monkeypatch):
+    """Test worker copies args.disable_debug_images onto the formatter."""
+    seen = []
+    monkeypatch.setattr(Formatter, 'format_check', lambda self, submission, paper_type: seen.append(self.render_debug_images))
+    # store_false: False means --disable_debug_images was given
+    for flag in (False, True):
+        monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_debug_images=flag))
+        worker('some/path/1234_testpaper.pdf', 'long')
+    assert seen == [False, True]
+
+
+def test_margin_violations_codes():
+    """Test margin_violations classifies boxes by the margin they bleed into, top first."""
+    # columns: inside the text area, top, left, right, top and left at once
+    x0 = np.array([100.0, 100.0, 10.0, 100.0, 10.0])
+    x1 = np.array([200.0, 200.0, 60.0, 590.0, 60.0])
+    top = np.array([100.0, 10.0, 100.0, 100.0, 10.0])
+    bottom = np.array([110.0, 20.0, 110.0, 110.0, 20.0])
+    codes = margin_violations(x0, x1, top, bottom, 56, 69, 66.5, Page.WIDTH.value)
+    assert [MARGIN_CODES[c] for c in codes] == [None, Margin.TOP, Margin.LEFT, Margin.RIGHT, Margin.TOP]
+
+
 def test_check_page_margin_catches_parsing_errors(monkeypatch, tmp_path):
     """Test check_page_margin logs parsing errors when exception occurs."""
     monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_bottom_check=False))
@@ -145,6 +225,8 @@ def test_check_page_margin_catches_parsing_errors(monkeypatch, tmp_path):
     def raise_error(*a, **kw):
         raise Exception("Parse error!")
     bad_page.images = []
+    # A char in the margin, so that the words of the page are extracted
+    bad_page.chars = [{"non_stroking_color": (10, 10, 10), "stroking_color": None, "x0": 0, "x1": 30, "top": 10, "bottom": 20}]
     bad_page.extract_words.side_effect = raise_error
     bad_page.crop = lambda bbox: MagicMock()
     bad_page.to_image = lambda resolution=None: MagicMock()
@@ -222,6 +304,18 @@ def test_check_page_num_exceeds_threshold_and_adds_log():
     assert "References" in log_msg
 
 
+def test_check_page_num_reports_line_of_first_marker():
+    """Test check_page_num reports the line of the earliest marker on the page, not of the first candidate found."""
+    f = Formatter()
+    f.logs = defaultdict(list)
+    f.page_errors = set()
+    marker_page = DummyPage(extract_text_result='Conclusion\nWe showed it\nLimitations are few\nReferences\n[1] A paper')
+    pages = [DummyPage(extract_text_result='Nothing') for _ in range(6)] + [marker_page] + [DummyPage(extract_text_result='Nothing')]*3
+    f.pdf = make_pdf_mock(pages)
+    f.check_page_num("short")
+    assert "page 7, line 3." in f.logs[Error.PAGELIMIT][0]
+
+
 def test_check_page_num_with_all_pages_in_page_errors():
     """Test check_page_num does not log if all pages have errors."""
     f = Formatter()
@@ -272,6 +366,65 @@ def test_check_references_found_references_with_links(monkeypatch):
     assert not any("not using paper links" in str(m) or "Only 0 links found" in str(m) for m in f.logs[Warn.BIB])
 
 
+class FakeMupdfDoc(list):
+    """A PyMuPDF document: a list of pages that can be closed."""
+    closed = False
+    def close(self):
+        self.closed = True
+
+
+def test_cached_page_plain_text():
+    """Test plain_text comes from the MuPDF page when there is one, else from pdfplumber."""
+    page = DummyPage(extract_text_result='pdfplumber text')
+    assert CachedPage(page).plain_text == 'pdfplumber text'
+    mupdf_page = SimpleNamespace(get_text=lambda: 'mupdf text')
+    assert CachedPage(page, mupdf_page).plain_text == 'mupdf text'
+
+
+def test_open_mupdf_attaches_pages(monkeypatch):
+    """Test open_mupdf gives each cached page its MuPDF page, and close_pdf closes the document."""
+    mupdf_pages = [SimpleNamespace(get_text=lambda: 'References\n[1] arXiv')]
+    monkeypatch.setattr('aclpubcheck.formatchecker.pymupdf', SimpleNamespace(open=lambda path: FakeMupdfDoc(mupdf_pages)))
+    f = Formatter()
+    f.pdfpath = 'some/path/1234_testpaper.pdf'
+    f.pdf = make_pdf_mock([DummyPage(extract_text_result='no marker')])
+    f.open_mupdf()
+    doc = f.mupdf_doc
+    assert f.cached_pages()[0].plain_text == 'References\n[1] arXiv'
+    f.close_pdf()
+    assert doc.closed and f.mupdf_doc is None
+
+
+def test_format_check_opens_mupdf_only_when_asked(monkeypatch, tmp_path):
+    """Test format_check opens the PDF with PyMuPDF only when use_mupdf is given, even if it is installed."""
+    opened = []
+    def mupdf_open(path):
+        opened.append(path)
+        return FakeMupdfDoc([SimpleNamespace(get_text=lambda: '')])
+    monkeypatch.setattr('aclpubcheck.formatchecker.pymupdf', SimpleNamespace(open=mupdf_open))
+    monkeypatch.setattr('aclpubcheck.formatchecker.pdfplumber.open', lambda x: make_pdf_mock([DummyPage()]))
+    monkeypatch.setattr('aclpubcheck.formatchecker.dump_logs', lambda *a, **kw: None)
+    # the name check is disabled
+    monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_name_check=False))
+    f = Formatter()
+    f.check_page_size = lambda: None
+    f.check_page_margin = lambda out: None
+    f.check_page_num = lambda paper_type: None
+    f.check_font = lambda: None
+    f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path), check_references=False)
+    f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path), check_references=True)
+    assert opened == []
+    f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path), check_references=True, use_mupdf=True)
+    assert opened == ['xx/456_testpaper.pdf']
+
+
+def test_format_check_use_mupdf_requires_pymupdf(monkeypatch):
+    """Test asking for PyMuPDF without it installed fails instead of silently using pdfminer."""
+    monkeypatch.setattr('aclpubcheck.formatchecker.pymupdf', None)
+    with pytest.raises(ImportError):
+        Formatter().format_check('xx/456_testpaper.pdf', 'short', check_references=True, use_mupdf=True)
+
+
 def test_format_check_runs_all(monkeypatch, tmp_path):
     """Test format_check runs and aggregates logs when errors exist."""
     monkeypatch.setattr('aclpubcheck.formatchecker.pdfplumber.open', lambda x: make_pdf_mock([DummyPage()]))
@@ -283,21 +436,35 @@ def test_format_check_runs_all(monkeypatch, tmp_path):
     f.check_page_num = lambda paper_type: f.logs.setdefault(Error.PAGELIMIT, []).append('error-pagelimit')
     f.check_font = lambda: f.logs.setdefault(Error.FONT, []).append('error-font')
     f.check_references = lambda: f.logs.setdefault(Warn.BIB, []).append('warn-bib')
-    # Patch json.dump to avoid filesystem
-    with patch('aclpubcheck.formatchecker.json.dump') as json_dump:
+    # Patch dump_logs to avoid filesystem
+    with patch('aclpubcheck.formatchecker.dump_logs') as dump_logs:
         result = f.format_check('some/path/1234_testpaper.pdf', 'long', output_dir=str(tmp_path), print_only_errors=False, check_references=True)
         assert Error.SIZE.name in result
         assert Error.MARGIN.name in result
         assert Error.PAGELIMIT.name in result
         assert Error.FONT.name in result
         assert Warn.BIB.name in result
-        assert json_dump.called
+        assert dump_logs.called
+
+
+def test_format_check_reports_in_check_order(monkeypatch, tmp_path):
+    """Test the errors are reported in the order the checks run, not the order of the Error enum."""
+    monkeypatch.setattr('aclpubcheck.formatchecker.pdfplumber.open', lambda x: make_pdf_mock([DummyPage()]))
+    monkeypatch.setattr('aclpubcheck.formatchecker.dump_logs', lambda *a, **kw: None)
+    f = Formatter()
+    f.check_page_size = lambda: f.logs[Error.SIZE].append('error-size')
+    f.check_page_margin = lambda output_dir: f.logs[Error.PARSING].append('error-parsing')
+    f.check_page_num = lambda paper_type: f.logs[Error.PAGELIMIT].append('error-pagelimit')
+    f.check_font = lambda: f.logs[Error.FONT].append('error-font')
+    f.check_references = lambda: f.logs[Warn.BIB].append('warn-bib')
+    result = f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path), check_references=True)
+    assert list(result) == ['Error.SIZE', 'Error.PARSING', 'Error.PAGELIMIT', 'Error.FONT', 'Warn.BIB']
 
 
 def test_format_check_returns_empty_when_no_logs(monkeypatch, tmp_path):
     """Test format_check returns empty result and prints all clear if no issues."""
     monkeypatch.setattr('aclpubcheck.formatchecker.pdfplumber.open', lambda x: make_pdf_mock([DummyPage()]))
-    monkeypatch.setattr('aclpubcheck.formatchecker.json.dump', lambda *a, **kw: None)
+    monkeypatch.setattr('aclpubcheck.formatchecker.dump_logs', lambda *a, **kw: None)
     monkeypatch.setattr('aclpubcheck.formatchecker.args', SimpleNamespace(disable_name_check=True, disable_bottom_check=False))
     f = Formatter()
     f.check_page_size = lambda: None
@@ -307,3 +474,38 @@ def test_format_check_returns_empty_when_no_logs(monkeypatch, tmp_path):
     f.check_references = lambda: None
     result = f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path), print_only_errors=False, check_references=True)
     assert result == {}
+
+
+def test_format_check_closes_pdf_when_a_check_raises(monkeypatch, tmp_path):
+    """Test format_check closes the PDF and drops the page cache even if a check fails."""
+    pdf = make_pdf_mock([DummyPage()])
+    monkeypatch.setattr('aclpubcheck.formatchecker.pdfplumber.open', lambda x: pdf)
+    f = Formatter()
+    mupdf_doc = FakeMupdfDoc()
+    def failing_check():
+        f.cached_pages()
+        f.mupdf_doc = mupdf_doc
+        raise RuntimeError("check failed")
+    f.check_page_size = failing_check
+    with pytest.raises(RuntimeError):
+        f.format_check('xx/456_testpaper.pdf', 'short', output_dir=str(tmp_path))
+    assert pdf.close.called
+    assert mupdf_doc.closed
+    assert f._pages is None and f.mupdf_doc is None
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dump_logs_writes_json(monkeypatch, tmp_path, use_orjson):
+    """Test dump_logs writes the logs as json, with or without orjson."""
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr('aclpubcheck.formatchecker.orjson', None)
+    logs_json = {"Error.FONT": ["Wrong font: Überschrift"], "Warn.BIB": []}
+    path = tmp_path / "errors-1234.json"
+    dump_logs(logs_json, str(path))
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == logs_json
+    if not use_orjson:
+        # exactly what json.dump has always written
+        assert path.read_text() == json.dumps(logs_json)